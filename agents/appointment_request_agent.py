@@ -1,84 +1,194 @@
 # agents/appointment_request_agent.py
 import json
+import logging
 import re
+from typing import ClassVar
+from pydantic import TypeAdapter
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from agents.base import BaseAgent
 from agents.claude_client import claude_client
-from agents.schemas import AppointmentRequest, AppointmentAction, AppointmentResult
+from agents.intervals import IntervalIndex
+from agents.scheduler import SLOT_DURATION, business_slots, shortlist_slots, create_action, decide_actions, validate_actions
+from agents.schemas import AppointmentRequest, AppointmentAction, AppointmentResult, BatchRequestOutcome
 from appointments.models import Appointment, Client
 from django.contrib.auth.models import User
-from django.utils.dateparse import parse_datetime
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# How far ahead requests look for a slot; rolling, so weekends and full weeks still get booked
+SCHEDULING_DAYS_AHEAD = 7
+
+JSON_DECODER = json.JSONDecoder()
+# Validates a whole action array in one pass
+ACTION_LIST_ADAPTER = TypeAdapter(list[AppointmentAction])
+# Slot index in a ranking response
+SLOT_INDEX_PATTERN = re.compile(r'\d+')
+
+SYSTEM_PROMPT = """
+You are an Appointment Scheduling Agent. Given an appointment request and the current clinician calendar, 
+you must generate a list of actions to take to accommodate the appointment. Never reject appointments.
+Return your decisions as a JSON array of AppointmentAction objects.
+
+Appointment scheduling rules:
+- An appointment is urgent if the urgency field in the AppointmentRequest is True
+- Assume all existing appointments are NOT urgent!
+- A clinician can only have one appointment per client at a time (i.e. no overlapping appointments)
+- The appointment must be scheduled on or after the current time
+- All appointments must be scheduled ON THE HOUR (e.g., 9:00, 10:00, 11:00, etc.)
+- All appointments must be between 9:00 AM and 5:00 PM (business hours)
+- All appointments must be 60 minutes in duration
+- The response must be a JSON format with no new lines or extra spaces
+
+Handle urgent appointments with the following rules:
+- Urgent appointments should be always scheduled as close to the current time as possible
+- If an existing appointment is blocking a potential urgent appointment time slot, identify the next available time slot and schedule the existing appointment there (i.e. update the existing appointment)
+
+Handle non-urgent appointments with the following rules:
+- The appointment must be booked by preference
+- Book at the soonest available time in the future
+- Never update an existing urgent appointment
+
+You should return a list of AppointmentAction objects. With the following format:
+[
+    {
+        "action": "create" or "update",
+        "start_time": "ISO datetime string (must be on the hour between 9 AM and 5 PM)",
+        "client_id": integer,
+        "clinician_id": integer,
+        "appointment_id": integer (only required for update actions)
+    }
+]
+"""
+
+RANKING_SYSTEM_PROMPT = """
+You are an Appointment Scheduling Agent. You will be given an appointment request and a numbered list
+of time slots that already satisfy every scheduling rule. Choose the slot the client is most likely to accept.
+
+Ranking rules:
+- Prefer slots matching the time_of_day_preference hour, then slots in the same time_period
+- Among equally preferred slots, choose the soonest one
+- Reply with ONLY the number of the chosen slot, nothing else
+"""
+
+# User prompts; only the fields in braces change between requests
+USER_PROMPT_TEMPLATE = """
+The current time is {current_time}.
+Given the following appointment request and available time slots, generate a list of actions to take to accommodate the appointment.
+The current appointment request is: {request}
+The following time slots are available, as date: start hours on a 24-hour clock:
+{slots}
+"""
+
+RANKING_PROMPT_TEMPLATE = """
+The current appointment request is: {request}
+The candidate time slots are:
+{slots}
+"""
 
 # @TODO: ask Eitan what he wants the response from the agent to be
 class AppointmentRequestAgent(BaseAgent):
-    @property
-    def system_prompt(self) -> str:
-        return """
-        You are an Appointment Scheduling Agent. Given an appointment request and the current clinician calendar, 
-        you must generate a list of actions to take to accommodate the appointment. Never reject appointments.
-        Return your decisions as a JSON array of AppointmentAction objects.
-
-        Appointment scheduling rules:
-        - An appointment is urgent if the urgency field in the AppointmentRequest is True
-        - Assume all existing appointments are NOT urgent!
-        - A clinician can only have one appointment per client at a time (i.e. no overlapping appointments)
-        - The appointment must be scheduled on or after the current time
-        - All appointments must be scheduled ON THE HOUR (e.g., 9:00, 10:00, 11:00, etc.)
-        - All appointments must be between 9:00 AM and 5:00 PM (business hours)
-        - All appointments must be 60 minutes in duration
-        - The response must be a JSON format with no new lines or extra spaces
-    
-        Handle urgent appointments with the following rules:
-        - Urgent appointments should be always scheduled as close to the current time as possible
-        - If an existing appointment is blocking a potential urgent appointment time slot, identify the next available time slot and schedule the existing appointment there (i.e. update the existing appointment)
-
-        Handle non-urgent appointments with the following rules:
-        - The appointment must be booked by preference
-        - Book at the soonest available time in the future
-        - Never update an existing urgent appointment
-
-        You should return a list of AppointmentAction objects. With the following format:
-        [
-            {
-                "action": "create" or "update",
-                "start_time": "ISO datetime string (must be on the hour between 9 AM and 5 PM)",
-                "client_id": integer,
-                "clinician_id": integer,
-                "appointment_id": integer (only required for update actions)
-            }
-        ]
-        """
-
-    def infer(self, request: AppointmentRequest) -> list[AppointmentAction]:
-        """Infer the actions needed to accommodate the appointment request."""
-        available_time_slots = self.get_available_time_slots(request.clinician_id)
-
-        prompt = f"""
-        The current time is {timezone.now().strftime("%Y-%m-%d %H:%M:%S")}.
-        Given the following appointment request and available time slots, generate a list of actions to take to accommodate the appointment.
-        The current appointment request is: {request.__str__()}
-        The following time slots are available:
-        {available_time_slots}
-        """
-        print(prompt)
+    system_prompt: ClassVar[str] = SYSTEM_PROMPT
+    ranking_system_prompt: ClassVar[str] = RANKING_SYSTEM_PROMPT
+
+    def __init__(self):
+        # Booked appointments per (clinician, first day, last day), reused until this agent writes to the calendar
+        self._appointments = {}
+
+    def infer(self, request: AppointmentRequest, complex_request: bool = False) -> list[AppointmentAction]:
+        """
+        Infer the actions needed to accommodate the appointment request.
+
+        Scheduling is solved locally by decide_actions(): hard constraints (business
+        hours, on the hour, no overlaps, urgency) and the time preference are applied in
+        Python. Set USE_LOCAL_SCHEDULER = False to have Claude rank the shortlisted slots
+        for non-urgent requests instead, or pass complex_request to let Claude plan the
+        full action list.
+        """
+        if complex_request:
+            return self.infer_actions(request)
+
+        now = timezone.localtime()
+        if request.urgency or getattr(settings, "USE_LOCAL_SCHEDULER", True):
+            actions = self.plan_locally(request, now)
+        else:
+            actions = [create_action(request, self.choose_slot(request, now))]
+
+        self.execute_actions(actions)
+
+        return actions
+
+    def plan_locally(self, request: AppointmentRequest, now) -> list[AppointmentAction]:
+        """Plan the request with the local scheduler, from the clinician's current calendar."""
+        return decide_actions(
+            request,
+            business_slots(now, SCHEDULING_DAYS_AHEAD),
+            self.get_upcoming_appointments(request.clinician_id, now),
+            now,
+        )
+
+    def choose_slot(self, request: AppointmentRequest, now=None):
+        """Choose the slot for a non-urgent request, letting Claude rank the preferred shortlist."""
+        available_slots = self.get_open_slots(request.clinician_id, now)
+        if not available_slots:
+            raise ValueError(f"No available time slots in the next {SCHEDULING_DAYS_AHEAD} days")
+
+        candidate_slots = shortlist_slots(request, available_slots)
+        if request.time_of_day_preference is None or len(candidate_slots) == 1:
+            return candidate_slots[0]
+
+        return candidate_slots[self.rank_slots(request, candidate_slots)]
+
+    def get_upcoming_appointments(self, clinician_id: int, now, days_ahead: int = SCHEDULING_DAYS_AHEAD) -> list:
+        """Get the clinician's booked appointments from now until days_ahead days out, including any still running."""
+        # Start a day back to include appointments that started before now but may still be running
+        return self.get_appointments(clinician_id, now - timedelta(days=1), now + timedelta(days=days_ahead))
+
+    def rank_slots(self, request: AppointmentRequest, slots: list) -> int:
+        """Ask Claude for the index of the preferred slot, falling back to the soonest slot."""
+        numbered_slots = "\n".join(
+            f"{index}: {slot.strftime('%A, %B %d at %I:%M %p')}" for index, slot in enumerate(slots)
+        )
+        prompt = RANKING_PROMPT_TEMPLATE.format(request=request.model_dump_json(), slots=numbered_slots)
 
         output = claude_client.messages.create(
             model="claude-3-7-sonnet-latest",
-            max_tokens=1024,
-            system=self.system_prompt,
+            max_tokens=64,
+            system=self.ranking_system_prompt,
             messages=[
                 {"role": "user", "content": prompt}
             ]
         ).content[0].text
 
-        print(output)
+        match = SLOT_INDEX_PATTERN.search(output)
+        if not match or int(match.group()) >= len(slots):
+            logger.warning("Unusable slot ranking from Claude, booking the soonest slot: %r", output)
+            return 0
+
+        return int(match.group())
+
+    def infer_actions(self, request: AppointmentRequest) -> list[AppointmentAction]:
+        """Let Claude plan the full list of actions for the appointment request."""
+        prompt = self.build_prompt(request)
+        logger.debug("Appointment prompt: %s", prompt)
+
+        output = self.stream_until_json_array(self.message_params(prompt))
+
+        logger.debug("Claude output: %s", output)
 
         # Parse the JSON output to get AppointmentAction objects
         try:
-            actions_data = self.extract_json_array_from_claude(output)
+            actions_data = self._validate_actions(self.extract_json_array_from_claude(output), timezone.localtime())
+
+            logger.debug("Validated actions: %s", actions_data)
 
-            print(actions_data)
+            # Nothing left books the request (every conflicting action was dropped), so
+            # the remaining moves serve no purpose; plan it locally instead
+            if not any(action.action == "create" for action in actions_data):
+                logger.warning("Claude's plan no longer books the request, scheduling it locally")
+                actions_data = self.plan_locally(request, timezone.localtime())
 
             self.execute_actions(actions_data)
 
@@ -88,136 +198,325 @@ class AppointmentRequestAgent(BaseAgent):
             raise ValueError(f"Failed to create AppointmentAction objects: {e}")
 
         return actions_data
-   
+
+    def stream_until_json_array(self, params: dict) -> str:
+        """
+        Stream a Claude response and stop as soon as the first top-level JSON array is complete.
+
+        Any prose Claude adds after the array is never generated, which saves the tail
+        latency of waiting for the full message.
+        """
+        output = ""
+        depth = 0
+        array_start = 0
+        in_string = False
+        escaped = False
+
+        with claude_client.messages.stream(**params) as stream:
+            for text in stream.text_stream:
+                chunk_start = len(output)
+                output += text
+                for offset, char in enumerate(text):
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif char == "\\":
+                            escaped = True
+                        elif char == '"':
+                            in_string = False
+                    elif char == '"' and depth:
+                        in_string = True
+                    elif char == "[":
+                        if not depth:
+                            array_start = chunk_start + offset
+                        depth += 1
+                    elif char == "]" and depth:
+                        depth -= 1
+                        # Bracketed prose before the array doesn't count; stop only on
+                        # what extract_json_array_from_claude() would accept
+                        if depth == 0 and self.decode_action_array(output, array_start) is not None:
+                            # Leaving the block closes the HTTP response
+                            return output
+
+        return output
+
+    def build_prompt(self, request: AppointmentRequest) -> str:
+        """Build the user prompt for an appointment request from the clinician's current availability."""
+        now = timezone.localtime()
+        available_time_slots = self.get_available_time_slots(request.clinician_id, now)
+
+        return USER_PROMPT_TEMPLATE.format(
+            current_time=now.strftime("%Y-%m-%d %H:%M:%S"),
+            request=request.model_dump_json(),
+            slots="; ".join(available_time_slots),
+        )
+
+    def message_params(self, prompt: str) -> dict:
+        """Build the Messages API parameters shared by the synchronous and batch paths."""
+        return {
+            "model": "claude-3-7-sonnet-latest",
+            "max_tokens": 1024,
+            # Mark the static scheduling rules as a cacheable prefix. Sonnet only caches
+            # prefixes of at least 1024 tokens, and these rules are about 400, so the
+            # marker is ignored until the prompt grows past that; it costs nothing meanwhile
+            "system": [
+                {
+                    "type": "text",
+                    "text": self.system_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ],
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+        }
+
+    def submit_batch(self, requests: list[AppointmentRequest]) -> str:
+        """
+        Submit non-urgent appointment requests through the Message Batches API.
+
+        Batches are billed at half the synchronous rate but may take up to 24 hours
+        to complete, so urgent requests are rejected and must use infer(). Each request's
+        custom_id names its client and clinician, so a client can only appear once per
+        clinician in a batch. Returns the batch id to pass to collect_batch() once
+        processing has ended; the batch_requests management command does both.
+        """
+        if any(request.urgency for request in requests):
+            raise ValueError("Urgent appointment requests must be scheduled with infer(), not batched")
+
+        custom_ids = [self.batch_custom_id(request) for request in requests]
+        if len(set(custom_ids)) != len(custom_ids):
+            raise ValueError("Each client can only be batched once per clinician")
+
+        batch = claude_client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": custom_id,
+                    "params": self.message_params(self.build_prompt(request)),
+                }
+                for custom_id, request in zip(custom_ids, requests)
+            ]
+        )
+        return batch.id
+
+    @staticmethod
+    def batch_custom_id(request: AppointmentRequest) -> str:
+        return f"client-{request.client_id}-clinician-{request.clinician_id}"
+
+    def collect_batch(self, batch_id: str) -> dict[str, BatchRequestOutcome] | None:
+        """
+        Execute the plans from a finished batch and report what happened to each request.
+
+        Returns None while the batch is still processing, otherwise an outcome per custom_id.
+        Results can arrive up to a day after the prompts were built, so each plan is checked
+        against the current calendar and time; a plan that lost any action is rejected as a
+        conflict rather than half executed, and the request should be resubmitted.
+        """
+        batch = claude_client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return None
+
+        outcomes = {}
+        for entry in claude_client.messages.batches.results(batch_id):
+            try:
+                outcome = self.collect_batch_entry(entry)
+            except Exception as e:
+                # A plan that fails to execute (e.g. a deleted client) must not stop the
+                # rest of the batch being booked and reported
+                outcome = BatchRequestOutcome(custom_id=entry.custom_id, status="failed", detail=str(e))
+
+            outcomes[entry.custom_id] = outcome
+            if outcome.status != "booked":
+                logger.warning("Batch %s request %s %s: %s", batch_id, entry.custom_id, outcome.status, outcome.detail)
+
+        return outcomes
+
+    def collect_batch_entry(self, entry) -> BatchRequestOutcome:
+        """Validate and execute one batch result's plan as a whole."""
+        if entry.result.type != "succeeded":
+            return BatchRequestOutcome(custom_id=entry.custom_id, status=entry.result.type)
+
+        try:
+            actions = self.extract_json_array_from_claude(entry.result.message.content[0].text)
+        except ValueError as e:
+            return BatchRequestOutcome(custom_id=entry.custom_id, status="unparseable", detail=str(e))
+
+        valid_actions = self._validate_actions(actions, timezone.localtime())
+        if len(valid_actions) != len(actions) or not any(action.action == "create" for action in valid_actions):
+            return BatchRequestOutcome(
+                custom_id=entry.custom_id,
+                status="conflict",
+                detail=f"{len(actions) - len(valid_actions)} of {len(actions)} actions are in the past or overlap",
+            )
+
+        self.execute_actions(valid_actions)
+        return BatchRequestOutcome(custom_id=entry.custom_id, status="booked", actions=valid_actions)
+
+    def _validate_actions(self, actions: list[AppointmentAction], now=None) -> list[AppointmentAction]:
+        """Drop proposed actions that start before now or would overlap an existing appointment or another proposed action."""
+        valid_actions = []
+
+        for clinician_id in {action.clinician_id for action in actions}:
+            proposed = [action for action in actions if action.clinician_id == clinician_id]
+
+            # Every booking that could overlap a proposal, including ones running into the first
+            start_times = [action.start_time for action in proposed]
+            booked = self.get_appointments(
+                clinician_id, min(start_times) - timedelta(days=1), max(start_times) + timedelta(days=1)
+            )
+
+            valid_actions.extend(validate_actions(proposed, booked, now))
+
+        return valid_actions
+
     def execute_actions(self, actions: list[AppointmentAction]) -> list[AppointmentResult]:
         """Execute the list of AppointmentAction objects on the appointments database."""
         results = []
-        
+
+        for action in actions:
+            if action.action == "update" and not action.appointment_id:
+                raise ValueError("appointment_id is required for update actions")
+
+        # Fetch every referenced row up front instead of one lookup per action. Clients
+        # and clinicians are only checked for existence and linked by key, so skip
+        # their other columns (including the clinician's password hash)
+        clients = Client.objects.only('id').in_bulk({action.client_id for action in actions if action.action == "create"})
+        clinicians = User.objects.only('id').in_bulk({action.clinician_id for action in actions if action.action == "create"})
+        appointments = Appointment.objects.in_bulk({action.appointment_id for action in actions if action.action == "update"})
+
+        # Build every row in memory first so the writes go out as one INSERT and one UPDATE
+        changes = []
+        created = []
+        updated = []
         for action in actions:
             if action.action == "create":
                 # Get the Client and User objects
-                client = Client.objects.get(id=action.client_id)
-                clinician = User.objects.get(id=action.clinician_id)
+                client = clients.get(action.client_id)
+                clinician = clinicians.get(action.clinician_id)
+                if client is None or clinician is None:
+                    raise ValueError(f"Client {action.client_id} or clinician {action.clinician_id} not found")
                 
                 # Create a new appointment
-                appointment = Appointment.objects.create(
+                appointment = Appointment(
                     client=client,
                     clinician=clinician,
-                    start_time=parse_datetime(action.start_time),
+                    start_time=action.start_time,
                 )
-                
-                results.append(AppointmentResult(
-                    action_taken="created",
-                    appointment={
-                        "id": appointment.id,
-                        "client_id": appointment.client.id,
-                        "clinician_id": appointment.clinician.id,
-                        "start_time": appointment.start_time.isoformat(),
-                        "duration_in_minutes": appointment.duration_in_minutes
-                    }
-                ))
+                created.append(appointment)
+                changes.append(("created", appointment))
                 
             elif action.action == "update":
                 # Update an existing appointment
-                if not action.appointment_id:
-                    raise ValueError("appointment_id is required for update actions")
-                
-                appointment = Appointment.objects.get(id=action.appointment_id)
-                appointment.start_time = parse_datetime(action.start_time)
-                appointment.save()
-
-                results.append(AppointmentResult(
-                    action_taken="updated",
-                    appointment={
-                        "id": appointment.id,
-                        "client_id": appointment.client.id,
-                        "clinician_id": appointment.clinician.id,
-                        "start_time": appointment.start_time.isoformat(),
-                        "duration_in_minutes": appointment.duration_in_minutes
-                    }
-                ))
+                appointment = appointments.get(action.appointment_id)
+                if appointment is None:
+                    raise ValueError(f"Appointment {action.appointment_id} not found")
+
+                appointment.start_time = action.start_time
+                updated.append(appointment)
+                changes.append(("updated", appointment))
+
+        with transaction.atomic():
+            Appointment.objects.bulk_create(created)
+            Appointment.objects.bulk_update(updated, ["start_time"])
+
+        # The values were just written to the database, so skip re-validating them
+        for action_taken, appointment in changes:
+            results.append(AppointmentResult.model_construct(
+                action_taken=action_taken,
+                appointment={
+                    "id": appointment.id,
+                    "client_id": appointment.client_id,
+                    "clinician_id": appointment.clinician_id,
+                    "start_time": appointment.start_time.isoformat(),
+                    "duration_in_minutes": appointment.duration_in_minutes
+                }
+            ))
+
+        # The calendar changed, so cached appointments are stale
+        self._appointments.clear()
 
         return results
 
-    def get_weekly_appointments(self, clinician_id: int) -> list[Appointment]:
-        """Get available time slots for this week for the clinician (Monday-Friday, 9 AM - 5 PM)."""
-        from django.utils import timezone
-        from datetime import timedelta        
-        # Calculate the start of the current week (Monday)
-        now = timezone.now()
-        monday_9am = (now - timedelta(days=now.weekday())).replace(hour=9, minute=0, second=0, microsecond=0)
-        friday_5pm = (now + timedelta(days=4-now.weekday())).replace(hour=17, minute=0, second=0, microsecond=0)
-
-        weekly_appointments = Appointment.objects.filter(
-            clinician_id=clinician_id,
-            start_time__gte=monday_9am,
-            start_time__lte=friday_5pm
-        ).order_by('start_time')
-
-        return weekly_appointments
-
-    def get_available_time_slots(self, clinician_id: int) -> list:
-        """Get available time slots for this week for the clinician (Monday-Friday, 9 AM - 5 PM)."""
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Get all booked appointments for the week
-        weekly_appointments = self.get_weekly_appointments(clinician_id)
-        
-        # Calculate the start and end of the current week
-        now = timezone.now()
-        monday_9am = (now - timedelta(days=now.weekday())).replace(hour=9, minute=0, second=0, microsecond=0)
-        friday_5pm = (now + timedelta(days=4-now.weekday())).replace(hour=17, minute=0, second=0, microsecond=0)
-        
-        # Generate all possible time slots (on the hour, 60 minutes duration)
-        available_slots = []
-        current_slot = monday_9am
-        
-        while current_slot <= friday_5pm:
-            # Skip slots that are in the past
-            if current_slot < now:
-                current_slot += timedelta(hours=1)
-                continue
-            
-            # Skip weekends (Saturday = 5, Sunday = 6)
-            if current_slot.weekday() >= 5:
-                current_slot += timedelta(hours=1)
-                continue
-                
-            # Skip slots outside business hours (before 9 AM or after 5 PM)
-            if current_slot.hour < 9 or current_slot.hour >= 17:
-                current_slot += timedelta(hours=1)
-                continue
-                
-            # Check if this slot is available (not booked)
-            slot_end = current_slot + timedelta(minutes=60)
-            is_booked = weekly_appointments.filter(
-                start_time__lt=slot_end,
-                start_time__gte=current_slot
-            ).exists()
-            
-            if not is_booked:
-                available_slots.append(current_slot)
-            
-            current_slot += timedelta(hours=1)
-        
-        # Convert datetime objects to human readable strings
-        readable_slots = [slot.strftime("%A, %B %d at %I:%M %p") for slot in available_slots]
-        return readable_slots
+    def get_appointments(self, clinician_id: int, start, end) -> list:
+        """
+        Get the clinician's booked appointments starting in [start, end).
+
+        Rows are lightweight named tuples of (id, client_id, start_time, duration_in_minutes) rather
+        than model instances, since callers only need the booked intervals. The query covers
+        whole local days and is cached per clinician and day range, so windows built from a
+        fresh timezone.localtime() on each call still share one query.
+        """
+        first_day = timezone.localtime(start).date()
+        last_day = timezone.localtime(end).date()
+        key = (clinician_id, first_day, last_day)
+        if key not in self._appointments:
+            self._appointments[key] = list(Appointment.objects.filter(
+                clinician_id=clinician_id,
+                start_time__gte=timezone.make_aware(datetime.combine(first_day, time.min)),
+                start_time__lt=timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min))
+            ).order_by('start_time').values_list('id', 'client_id', 'start_time', 'duration_in_minutes', named=True))
+
+        return [appointment for appointment in self._appointments[key] if start <= appointment.start_time < end]
+
+    def get_open_slots(self, clinician_id: int, now=None) -> list:
+        """
+        Get the clinician's open slot start times for the next SCHEDULING_DAYS_AHEAD days
+        (Monday-Friday, 9 AM - 5 PM), soonest first.
+
+        Pass now to share one clock reading with the caller, so the window and the
+        past-slot cutoff can't straddle a boundary.
+        """
+        now = now or timezone.localtime()
+
+        # Get all booked appointments in the window and index them once
+        booked = IntervalIndex.from_appointments(self.get_upcoming_appointments(clinician_id, now))
+
+        # Keep future slots that no booked appointment overlaps
+        return booked.free_slots(business_slots(now, SCHEDULING_DAYS_AHEAD), SLOT_DURATION)
+
+    def get_available_time_slots(self, clinician_id: int, now=None) -> list:
+        """
+        Get the clinician's available time slots for the next SCHEDULING_DAYS_AHEAD days (Monday-Friday, 9 AM - 5 PM).
+
+        Slots are grouped per day as "Thu 2025-01-16: 9,10,14" rather than spelled out
+        one by one, which takes a fraction of the prompt tokens.
+        """
+        hours_by_day = {}
+        for slot in self.get_open_slots(clinician_id, now):
+            hours_by_day.setdefault(slot.strftime("%a %Y-%m-%d"), []).append(str(slot.hour))
+
+        compact_slots = [f"{day}: {','.join(hours)}" for day, hours in hours_by_day.items()]
+        return compact_slots
+
+    @staticmethod
+    def decode_action_array(text: str, start: int) -> list | None:
+        """Decode the JSON array at text[start], or return None unless it is a non-empty list of objects."""
+        try:
+            raw_list, _ = JSON_DECODER.raw_decode(text, start)
+        except json.JSONDecodeError:
+            return None
+
+        if isinstance(raw_list, list) and raw_list and all(isinstance(obj, dict) for obj in raw_list):
+            return raw_list
+        return None
 
     def extract_json_array_from_claude(self, response_text: str) -> list[AppointmentAction]:
         """
         Extract the first valid JSON array from the Claude response and convert it into AppointmentAction objects.
         """
-        # Regex to extract only the first top-level array of objects
-        match = re.search(r'(\[\s*{.*?}\s*\])', response_text, re.DOTALL)
-        if not match:
+        # Jump to each '[' and let the JSON parser find where the array ends, instead
+        # of backtracking a regex over the whole response
+        start = response_text.find("[")
+        while start != -1:
+            # Skip bracketed prose and arrays that aren't a list of actions
+            raw_list = self.decode_action_array(response_text, start)
+            if raw_list is not None:
+                break
+            start = response_text.find("[", start + 1)
+        else:
             raise ValueError("No JSON array found in response")
 
-        json_str = match.group(1)
-
         try:
-            raw_list = json.loads(json_str)
-            return [AppointmentAction.model_validate(obj) for obj in raw_list]
+            return ACTION_LIST_ADAPTER.validate_python(raw_list)
         except Exception as e:
-            raise ValueError(f"Error parsing JSON array: {e}")
\ No newline at end of file
+            raise ValueError(f"Error parsing JSON array: {e}")
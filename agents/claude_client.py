@@ -3,4 +3,7 @@ from dotenv import load_dotenv
 import os
 
 load_dotenv()
-claude_client = Anthropic(api_key=os.getenv("CLAUDE_API_KEY")) 
\ No newline at end of file
+# One shared client so every agent reuses the SDK's keep-alive connection pool.
+# Calls run inside web requests, so fail after a minute instead of the SDK's
+# 10 minute default
+claude_client = Anthropic(api_key=os.getenv("CLAUDE_API_KEY"), timeout=60.0) 
@@ -0,0 +1,68 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+
+def to_epoch(value: datetime) -> int:
+    """Convert an aware datetime to integer epoch seconds."""
+    return int(value.timestamp())
+
+
+class IntervalIndex:
+    """
+    Static index of booked [start, end) intervals for overlap queries.
+
+    Intervals are kept sorted by start alongside a running maximum of their end
+    times (the flattened equivalent of an interval tree's max_high field), so
+    checking a candidate slot is a single binary search instead of a scan.
+
+    Bounds are stored as epoch seconds: the booked rows come back in UTC while slots
+    are built in local time, and comparing aware datetimes across zones pays for a
+    utcoffset() lookup on every comparison.
+    """
+
+    def __init__(self, intervals: list[tuple[datetime, datetime]]):
+        intervals = sorted((to_epoch(start), to_epoch(end)) for start, end in intervals)
+        self._starts = [start for start, _ in intervals]
+        self._max_ends = []
+        max_end = None
+        for _, end in intervals:
+            if max_end is None or end > max_end:
+                max_end = end
+            self._max_ends.append(max_end)
+
+    @classmethod
+    def from_appointments(cls, appointments) -> "IntervalIndex":
+        """Build an index from appointment rows (anything with start_time and duration_in_minutes)."""
+        return cls([
+            (appt.start_time, appt.start_time + timedelta(minutes=appt.duration_in_minutes))
+            for appt in appointments
+        ])
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """Return True if any indexed interval overlaps [start, end)."""
+        # Only intervals starting before `end` can overlap; of those, one does
+        # iff the furthest-reaching end is past `start`.
+        idx = bisect_left(self._starts, to_epoch(end))
+        return idx > 0 and self._max_ends[idx - 1] > to_epoch(start)
+
+    def free_slots(self, slot_starts: list[datetime], duration: timedelta) -> list[datetime]:
+        """
+        Return the slots from slot_starts (sorted ascending) that overlap no indexed interval.
+
+        Because both sides are sorted, the insertion point only moves forward, so the
+        whole batch is one merge walk rather than a binary search per slot.
+        """
+        free = []
+        idx = 0
+        duration_seconds = int(duration.total_seconds())
+        for slot in slot_starts:
+            start = to_epoch(slot)
+            end = start + duration_seconds
+            while idx < len(self._starts) and self._starts[idx] < end:
+                idx += 1
+            if idx == 0 or self._max_ends[idx - 1] <= start:
+                free.append(slot)
+        return free
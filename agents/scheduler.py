@@ -0,0 +1,181 @@
+# agents/scheduler.py
+import logging
+from datetime import timedelta
+from agents.intervals import IntervalIndex
+from agents.schemas import AppointmentRequest, AppointmentAction, time_period_for_hour
+
+logger = logging.getLogger(__name__)
+
+# Every appointment slot is one hour, starting on the hour
+SLOT_DURATION = timedelta(minutes=60)
+
+
+def business_slots(now, days_ahead: int) -> list:
+    """On-the-hour weekday slots between 9 AM and 4 PM starts, from now until days_ahead days out."""
+    window_end = now + timedelta(days=days_ahead)
+    today_9am = now.replace(hour=9, minute=0, second=0, microsecond=0)
+
+    slots = []
+    for day in range(days_ahead + 1):
+        day_9am = today_9am + timedelta(days=day)
+        if day_9am.weekday() >= 5:
+            continue
+        for hour in range(8):
+            slot = day_9am + timedelta(hours=hour)
+            if now <= slot < window_end:
+                slots.append(slot)
+
+    return slots
+
+
+def shortlist_slots(request: AppointmentRequest, slots: list, limit: int = 5) -> list:
+    """
+    Narrow the open slots to the few that best match the request's time preference.
+
+    Slots at the preferred hour come first, then slots in the preferred time period,
+    then the rest; the sort is stable so each group stays soonest first.
+    """
+    def preference_score(slot) -> int:
+        if slot.hour == request.time_of_day_preference:
+            return 2
+        if request.time_period is not None and time_period_for_hour(slot.hour) == request.time_period:
+            return 1
+        return 0
+
+    return sorted(slots, key=preference_score, reverse=True)[:limit]
+
+
+def create_action(request: AppointmentRequest, start_time) -> AppointmentAction:
+    return AppointmentAction(
+        action="create",
+        start_time=start_time,
+        client_id=request.client_id,
+        clinician_id=request.clinician_id,
+    )
+
+
+def schedule_urgent(request: AppointmentRequest, slots: list, appointments: list, now) -> list[AppointmentAction]:
+    """
+    Book an urgent request into the soonest slot.
+
+    Appointments blocking that slot are moved to the next free slots after it that fit
+    their whole length. If a blocker can't be moved (it is already running, or nothing
+    is free), the urgent appointment takes the soonest open slot instead.
+    """
+    if not slots:
+        raise ValueError("No available time slots for the urgent appointment")
+
+    soonest = slots[0]
+    blocking = [
+        appointment for appointment in appointments
+        if appointment.start_time < soonest + SLOT_DURATION
+        and soonest < appointment.start_time + timedelta(minutes=appointment.duration_in_minutes)
+    ]
+    if not blocking:
+        return [create_action(request, soonest)]
+
+    moves = place_blockers(blocking, slots[1:], appointments, soonest)
+    if moves is not None and all(appointment.start_time >= now for appointment in blocking):
+        return [create_action(request, soonest)] + [
+            AppointmentAction(
+                action="update",
+                start_time=new_slot,
+                client_id=appointment.client_id,
+                clinician_id=request.clinician_id,
+                appointment_id=appointment.id,
+            )
+            for appointment, new_slot in moves
+        ]
+
+    open_slots = IntervalIndex.from_appointments(appointments).free_slots(slots, SLOT_DURATION)
+    if not open_slots:
+        raise ValueError("No available time slots for the urgent appointment")
+
+    return [create_action(request, open_slots[0])]
+
+
+def place_blockers(blocking: list, slots: list, appointments: list, soonest) -> list | None:
+    """
+    Pair each blocking appointment with the first later slot that fits its full length.
+
+    A slot fits when the moved appointment, at its own duration, ends by 5 PM and overlaps
+    neither the appointments staying put, the urgent slot, nor the blockers already placed.
+    Returns None if any blocker can't be placed.
+    """
+    staying = IntervalIndex.from_appointments(
+        appointment for appointment in appointments if appointment not in blocking
+    )
+    placed = [(soonest, soonest + SLOT_DURATION)]
+
+    moves = []
+    for appointment in blocking:
+        duration = timedelta(minutes=appointment.duration_in_minutes)
+        for slot in slots:
+            end_time = slot + duration
+            if end_time > slot.replace(hour=17, minute=0) or staying.overlaps(slot, end_time):
+                continue
+            if any(slot < placed_end and placed_start < end_time for placed_start, placed_end in placed):
+                continue
+            placed.append((slot, end_time))
+            moves.append((appointment, slot))
+            break
+        else:
+            return None
+
+    return moves
+
+
+def decide_actions(request: AppointmentRequest, slots: list, appointments: list, now) -> list[AppointmentAction]:
+    """
+    Decide the actions for an appointment request without touching the database or Claude.
+
+    slots are the candidate start times (sorted ascending) and appointments the clinician's
+    booked rows around them, anything with id, client_id, start_time and duration_in_minutes.
+    Non-urgent requests get the open slot that best matches their time preference, soonest
+    first; urgent requests are handled by schedule_urgent().
+    """
+    if request.urgency:
+        return schedule_urgent(request, slots, appointments, now)
+
+    open_slots = IntervalIndex.from_appointments(appointments).free_slots(slots, SLOT_DURATION)
+    if not open_slots:
+        raise ValueError("No available time slots")
+
+    return [create_action(request, shortlist_slots(request, open_slots)[0])]
+
+
+def validate_actions(actions: list[AppointmentAction], appointments: list, now=None) -> list[AppointmentAction]:
+    """
+    Drop one clinician's proposed actions that would overlap a booked appointment or each other,
+    or that start before now when it is given.
+
+    Proposals are sorted by start time and swept, so each one only needs comparing against
+    the end of the last one kept plus a single probe of the booked-interval index. Appointments
+    being moved don't block their current time, but a dropped move leaves its appointment where
+    it is, so the sweep is repeated over the kept actions with that appointment booked again.
+    """
+    durations = {appointment.id: timedelta(minutes=appointment.duration_in_minutes) for appointment in appointments}
+    proposed = sorted(actions, key=lambda action: action.start_time)
+
+    while True:
+        moving_ids = {action.appointment_id for action in proposed if action.action == "update"}
+        booked = IntervalIndex.from_appointments(
+            appointment for appointment in appointments if appointment.id not in moving_ids
+        )
+
+        kept = []
+        previous_end = None
+        for action in proposed:
+            # A moved appointment keeps its own length; new ones are a single slot
+            end_time = action.start_time + durations.get(action.appointment_id, SLOT_DURATION)
+            if (now is not None and action.start_time < now) or booked.overlaps(action.start_time, end_time) \
+                    or (previous_end is not None and action.start_time < previous_end):
+                logger.warning("Dropping past or conflicting action: %s", action)
+                continue
+            kept.append(action)
+            previous_end = end_time if previous_end is None else max(previous_end, end_time)
+
+        if sum(action.action == "update" for action in kept) == sum(action.action == "update" for action in proposed):
+            # No move was dropped; dropping new appointments only frees time, so the rest still fit
+            return kept
+        proposed = kept
@@ -1,6 +1,17 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field, field_validator
 from typing import List, Optional, Literal
 from datetime import datetime
+from django.utils import timezone
+
+# Time period of each hour of the day: morning 9-11, afternoon 12-14, evening 15-17
+HOUR_TO_PERIOD = tuple(
+    "morning" if 9 <= hour <= 11 else "afternoon" if 12 <= hour <= 14 else "evening" if 15 <= hour <= 17 else None
+    for hour in range(24)
+)
+
+def time_period_for_hour(hour: int) -> Optional[str]:
+    return HOUR_TO_PERIOD[hour] if 0 <= hour < 24 else None
+
 
 class AppointmentRequest(BaseModel):
     client_id: int
@@ -8,17 +19,12 @@ class AppointmentRequest(BaseModel):
     urgency: bool
     time_of_day_preference: Optional[int] = None
 
+    @computed_field  # Included in model_dump_json() for the prompt
     @property
     def time_period(self) -> Optional[str]:
         if self.time_of_day_preference is None:
             return None
-        if 9 <= self.time_of_day_preference <= 11:
-            return "morning"
-        if 12 <= self.time_of_day_preference <= 14:
-            return "afternoon" 
-        if 15 <= self.time_of_day_preference <= 17:
-            return "evening"
-        return None
+        return time_period_for_hour(self.time_of_day_preference)
 
     def __str__(self):
         return f"AppointmentRequest(client_id={self.client_id}, clinician_id={self.clinician_id}, urgency={self.urgency}, time_of_day_preference={self.time_of_day_preference}, time_period={self.time_period})"
@@ -26,12 +32,28 @@ class AppointmentRequest(BaseModel):
 
 class AppointmentAction(BaseModel):
     action: Literal["create", "update"]
-    start_time: str
+    start_time: datetime  # Parsed once from the ISO string Claude returns
     client_id: int
     clinician_id: int
     appointment_id: Optional[int] = None  # Required for update actions
 
+    @field_validator("start_time")
+    @classmethod
+    def make_start_time_aware(cls, value: datetime) -> datetime:
+        # Claude sometimes omits the offset; treat those times as local like the rest of the app
+        if timezone.is_naive(value):
+            return timezone.make_aware(value)
+        return value
+
 
 class AppointmentResult(BaseModel):
     action_taken: str
-    appointment: dict 
\ No newline at end of file
+    appointment: dict 
+
+
+class BatchRequestOutcome(BaseModel):
+    """What happened to one request of a message batch, keyed by its custom_id."""
+    custom_id: str
+    status: Literal["booked", "conflict", "failed", "unparseable", "errored", "canceled", "expired"]
+    actions: List[AppointmentAction] = []  # Executed only when status is "booked"
+    detail: Optional[str] = None
@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from pydantic import TypeAdapter, ValidationError
+
+from agents.appointment_request_agent import AppointmentRequestAgent
+from agents.schemas import AppointmentRequest
+
+REQUEST_LIST_ADAPTER = TypeAdapter(list[AppointmentRequest])
+
+
+class Command(BaseCommand):
+    help = 'Submit non-urgent appointment requests as a Message Batch, or collect a finished batch'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='subcommand', required=True)
+
+        submit = subparsers.add_parser('submit', help='Submit the requests in a JSON file and print the batch id')
+        submit.add_argument(
+            'requests_file',
+            help='JSON array of appointment requests, e.g. [{"client_id": 1, "clinician_id": 2, "urgency": false}]'
+        )
+
+        collect = subparsers.add_parser('collect', help='Book a finished batch and print the outcome of each request')
+        collect.add_argument('batch_id', help='Batch id printed by submit')
+
+    def handle(self, *args, **options):
+        agent = AppointmentRequestAgent()
+
+        if options['subcommand'] == 'submit':
+            try:
+                with open(options['requests_file']) as requests_file:
+                    requests = REQUEST_LIST_ADAPTER.validate_python(json.load(requests_file))
+                batch_id = agent.submit_batch(requests)
+            except (OSError, json.JSONDecodeError, ValidationError, ValueError) as e:
+                raise CommandError(str(e))
+
+            self.stdout.write(self.style.SUCCESS(f'Submitted {len(requests)} requests as batch {batch_id}'))
+            self.stdout.write(f'Run "python manage.py batch_requests collect {batch_id}" once it has ended')
+            return
+
+        outcomes = agent.collect_batch(options['batch_id'])
+        if outcomes is None:
+            self.stdout.write(f'Batch {options["batch_id"]} is still processing; try again later')
+            return
+
+        for custom_id, outcome in outcomes.items():
+            line = f'{custom_id}: {outcome.status}'
+            if outcome.detail:
+                line += f' ({outcome.detail})'
+            self.stdout.write(self.style.SUCCESS(line) if outcome.status == 'booked' else self.style.WARNING(line))
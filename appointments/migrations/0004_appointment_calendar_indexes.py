@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 22:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_alter_appointment_duration_in_minutes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['clinician', 'start_time'], name='appointment_clinici_40d284_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['client', 'start_time'], name='appointment_client__2ecd83_idx'),
+        ),
+    ]
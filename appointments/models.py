@@ -28,5 +28,12 @@ class Appointment(models.Model):
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='appointments')
     clinician = models.ForeignKey(User, on_delete=models.CASCADE, related_name='appointments')
 
+    class Meta:
+        # Calendar lookups filter by clinician or client and a start_time range
+        indexes = [
+            models.Index(fields=['clinician', 'start_time']),
+            models.Index(fields=['client', 'start_time']),
+        ]
+
     def __str__(self):
         return f"{self.client.full_name} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
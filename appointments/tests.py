@@ -1,3 +1,371 @@
-from django.test import TestCase
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from agents.appointment_request_agent import AppointmentRequestAgent
+from agents.scheduler import business_slots, decide_actions, validate_actions
+from agents.schemas import AppointmentAction, AppointmentRequest, BatchRequestOutcome
+from appointments.models import Appointment, Client
+
+Booked = namedtuple('Booked', ['id', 'client_id', 'start_time', 'duration_in_minutes'])
+
+
+def local(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class DecideActionsTests(SimpleTestCase):
+    """The local scheduler is pure, so these run without the database or Claude."""
+
+    # Monday 8 AM, before the first slot of the week
+    now = local(2025, 1, 6, 8, 0)
+
+    def request(self, urgency=False, time_of_day_preference=None):
+        return AppointmentRequest(
+            client_id=1,
+            clinician_id=2,
+            urgency=urgency,
+            time_of_day_preference=time_of_day_preference,
+        )
+
+    def test_books_preferred_hour(self):
+        actions = decide_actions(self.request(time_of_day_preference=14), business_slots(self.now, 7), [], self.now)
+
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(actions[0].action, "create")
+        self.assertEqual(actions[0].start_time, local(2025, 1, 6, 14, 0))
+
+    def test_books_soonest_open_slot_without_preference(self):
+        booked = [Booked(10, 3, local(2025, 1, 6, 9, 0), 60), Booked(11, 4, local(2025, 1, 6, 10, 0), 60)]
+
+        actions = decide_actions(self.request(), business_slots(self.now, 7), booked, self.now)
+
+        self.assertEqual(actions[0].start_time, local(2025, 1, 6, 11, 0))
+
+    def test_preferred_hour_on_a_later_day_beats_same_period(self):
+        booked = [Booked(10, 3, local(2025, 1, 6, 10, 0), 60)]
+
+        actions = decide_actions(self.request(time_of_day_preference=10), business_slots(self.now, 7), booked, self.now)
+
+        self.assertEqual(actions[0].start_time, local(2025, 1, 7, 10, 0))
+
+    def test_falls_back_to_preferred_period_when_hour_is_booked_all_week(self):
+        booked = [Booked(day, 3, local(2025, 1, 6 + day, 10, 0), 60) for day in range(5)]
+
+        actions = decide_actions(self.request(time_of_day_preference=10), business_slots(self.now, 7), booked, self.now)
+
+        self.assertEqual(actions[0].start_time, local(2025, 1, 6, 9, 0))
+
+    def test_urgent_moves_blocking_appointment(self):
+        booked = [Booked(10, 3, local(2025, 1, 6, 9, 0), 60), Booked(11, 4, local(2025, 1, 6, 10, 0), 60)]
+
+        actions = decide_actions(self.request(urgency=True), business_slots(self.now, 7), booked, self.now)
+
+        self.assertEqual([action.action for action in actions], ["create", "update"])
+        self.assertEqual(actions[0].start_time, local(2025, 1, 6, 9, 0))
+        self.assertEqual(actions[1].appointment_id, 10)
+        self.assertEqual(actions[1].client_id, 3)
+        self.assertEqual(actions[1].start_time, local(2025, 1, 6, 11, 0))
+
+    def test_urgent_moves_blocker_to_a_slot_that_fits_its_length(self):
+        # A 90-minute blocker moved to 10:00 would run into the 11:00 booking
+        booked = [Booked(10, 3, local(2025, 1, 6, 9, 0), 90), Booked(11, 4, local(2025, 1, 6, 11, 0), 60)]
+
+        actions = decide_actions(self.request(urgency=True), business_slots(self.now, 7), booked, self.now)
+
+        self.assertEqual([action.action for action in actions], ["create", "update"])
+        self.assertEqual(actions[0].start_time, local(2025, 1, 6, 9, 0))
+        self.assertEqual(actions[1].start_time, local(2025, 1, 6, 12, 0))
+        self.assertEqual(validate_actions(actions, booked), actions)
+
+    def test_urgent_does_not_move_running_appointment(self):
+        now = local(2025, 1, 6, 9, 30)
+        booked = [Booked(10, 3, local(2025, 1, 6, 9, 0), 90)]
+
+        actions = decide_actions(self.request(urgency=True), business_slots(now, 7), booked, now)
+
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(actions[0].start_time, local(2025, 1, 6, 11, 0))
+
+    def test_weekend_request_books_next_monday(self):
+        for now in (local(2025, 1, 11, 10, 0), local(2025, 1, 10, 16, 30)):  # Saturday, Friday after the last slot
+            with self.subTest(now=now):
+                agent = AppointmentRequestAgent()
+                with mock.patch.object(agent, "get_appointments", return_value=[]):
+                    actions = agent.plan_locally(self.request(), now)
+
+                self.assertEqual(actions[0].start_time, local(2025, 1, 13, 9, 0))
+
+    def test_raises_when_window_is_full(self):
+        slots = business_slots(self.now, 7)
+        booked = [Booked(index, 3, slot, 60) for index, slot in enumerate(slots)]
+
+        with self.assertRaises(ValueError):
+            decide_actions(self.request(), slots, booked, self.now)
+
+
+class ValidateActionsTests(SimpleTestCase):
+    """The overlap sweep applied to Claude's plans before they are executed."""
+
+    def create(self, *start):
+        return AppointmentAction(action="create", start_time=local(*start), client_id=1, clinician_id=2)
+
+    def move(self, appointment_id, *start):
+        return AppointmentAction(
+            action="update", start_time=local(*start), client_id=3, clinician_id=2, appointment_id=appointment_id
+        )
+
+    def test_keeps_bump_plan_that_fits(self):
+        booked = [Booked(10, 3, local(2025, 1, 6, 9, 0), 60)]
+        plan = [self.create(2025, 1, 6, 9, 0), self.move(10, 2025, 1, 6, 10, 0)]
+
+        self.assertEqual(validate_actions(plan, booked), plan)
+
+    def test_dropped_move_puts_appointment_back(self):
+        # Appointment 10 can't move to 10:00, so it stays at 09:00 and the create there must go too
+        booked = [Booked(10, 3, local(2025, 1, 6, 9, 0), 60), Booked(11, 4, local(2025, 1, 6, 10, 0), 60)]
+        plan = [self.create(2025, 1, 6, 9, 0), self.move(10, 2025, 1, 6, 10, 0)]
+
+        self.assertEqual(validate_actions(plan, booked), [])
+
+    def test_drops_overlapping_proposals(self):
+        plan = [self.create(2025, 1, 6, 9, 0), self.create(2025, 1, 6, 9, 0), self.create(2025, 1, 6, 10, 0)]
+
+        self.assertEqual(validate_actions(plan, []), [plan[0], plan[2]])
+
+    def test_moved_appointment_keeps_its_length(self):
+        booked = [Booked(10, 3, local(2025, 1, 7, 9, 0), 90), Booked(11, 4, local(2025, 1, 6, 11, 0), 60)]
+
+        self.assertEqual(validate_actions([self.move(10, 2025, 1, 6, 10, 0)], booked), [])
+
+    def test_drops_actions_in_the_past(self):
+        plan = [self.create(2025, 1, 6, 9, 0), self.create(2025, 1, 6, 11, 0)]
+
+        self.assertEqual(validate_actions(plan, [], now=local(2025, 1, 6, 10, 0)), [plan[1]])
+
+
+class InferActionsTests(SimpleTestCase):
+    """Claude's plan is validated before it is executed."""
+
+    def test_plans_locally_when_no_create_survives_validation(self):
+        agent = AppointmentRequestAgent()
+        request = AppointmentRequest(client_id=1, clinician_id=2, urgency=True)
+        booked = [Booked(10, 3, local(2025, 1, 6, 9, 0), 60), Booked(11, 4, local(2025, 1, 6, 10, 0), 60)]
+        output = (
+            '[{"action": "create", "start_time": "2025-01-06T09:00:00", "client_id": 1, "clinician_id": 2},'
+            ' {"action": "update", "start_time": "2025-01-06T10:00:00", "client_id": 3, "clinician_id": 2, "appointment_id": 10}]'
+        )
+        local_plan = [AppointmentAction(action="create", start_time=local(2025, 1, 6, 11, 0), client_id=1, clinician_id=2)]
+
+        with mock.patch("django.utils.timezone.localtime", return_value=local(2025, 1, 6, 8, 0)), \
+                mock.patch.object(agent, "build_prompt", return_value=""), \
+                mock.patch.object(agent, "stream_until_json_array", return_value=output), \
+                mock.patch.object(agent, "get_appointments", return_value=booked), \
+                mock.patch.object(agent, "plan_locally", return_value=local_plan), \
+                mock.patch.object(agent, "execute_actions") as execute_actions:
+            actions = agent.infer_actions(request)
+
+        self.assertEqual(actions, local_plan)
+        execute_actions.assert_called_once_with(local_plan)
+
+
+class StreamUntilJsonArrayTests(SimpleTestCase):
+    """The stream stops at the first complete action array, however the text is chunked."""
+
+    def stream(self, *chunks):
+        agent = AppointmentRequestAgent()
+        consumed = []
+
+        def text_stream():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        with mock.patch("agents.appointment_request_agent.claude_client") as client:
+            client.messages.stream.return_value.__enter__.return_value.text_stream = text_stream()
+            output = agent.stream_until_json_array({})
+
+        return output, consumed
+
+    def test_stops_after_array_split_across_chunks(self):
+        output, consumed = self.stream('Here: [{"action": "cre', 'ate"}, {"a": 1}', '] done', " never read")
+
+        self.assertEqual(output, 'Here: [{"action": "create"}, {"a": 1}] done')
+        self.assertEqual(len(consumed), 3)
+
+    def test_brackets_and_quotes_inside_strings_do_not_end_the_array(self):
+        output, _ = self.stream('[{"note": "a ] and \\" quote"', ', "x": "["}]', " tail")
+
+        self.assertEqual(output, '[{"note": "a ] and \\" quote", "x": "["}]')
+
+    def test_skips_bracketed_prose_before_the_array(self):
+        array = '[{"action": "create", "start_time": "2025-01-06T09:00:00", "client_id": 1, "clinician_id": 2}]'
+        output, _ = self.stream("Options [{see below}] then ", array, " tail")
+
+        self.assertEqual(output, "Options [{see below}] then " + array)
+        self.assertEqual(len(AppointmentRequestAgent().extract_json_array_from_claude(output)), 1)
+
+
+class CollectBatchTests(SimpleTestCase):
+    """Each batch result is executed or rejected as a whole and reported under its custom_id."""
+
+    def entry(self, custom_id, text=None, result_type="succeeded"):
+        message = SimpleNamespace(content=[SimpleNamespace(text=text)])
+        return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type=result_type, message=message))
+
+    def test_reports_outcome_per_request(self):
+        agent = AppointmentRequestAgent()
+        booked = [Booked(10, 3, local(2025, 1, 6, 14, 0), 60)]
+        entries = [
+            self.entry("client-1-clinician-2", '[{"action": "create", "start_time": "2025-01-06T11:00:00", "client_id": 1, "clinician_id": 2}]'),
+            self.entry("client-5-clinician-2", '[{"action": "create", "start_time": "2025-01-06T14:00:00", "client_id": 5, "clinician_id": 2}]'),
+            self.entry("client-6-clinician-2", '[{"action": "create", "start_time": "2025-01-06T09:00:00", "client_id": 6, "clinician_id": 2}]'),
+            self.entry("client-7-clinician-2", "No slots"),
+            self.entry("client-8-clinician-2", result_type="expired"),
+        ]
+
+        with mock.patch("agents.appointment_request_agent.claude_client") as client, \
+                mock.patch("django.utils.timezone.localtime", return_value=local(2025, 1, 6, 10, 0)), \
+                mock.patch.object(agent, "get_appointments", return_value=booked), \
+                mock.patch.object(agent, "execute_actions") as execute_actions:
+            client.messages.batches.retrieve.return_value.processing_status = "ended"
+            client.messages.batches.results.return_value = entries
+            outcomes = agent.collect_batch("batch")
+
+        self.assertEqual(
+            {custom_id: outcome.status for custom_id, outcome in outcomes.items()},
+            {
+                "client-1-clinician-2": "booked",
+                "client-5-clinician-2": "conflict",
+                "client-6-clinician-2": "conflict",
+                "client-7-clinician-2": "unparseable",
+                "client-8-clinician-2": "expired",
+            },
+        )
+        execute_actions.assert_called_once_with(outcomes["client-1-clinician-2"].actions)
+
+    def test_execution_failure_is_reported_and_the_rest_still_booked(self):
+        agent = AppointmentRequestAgent()
+        entries = [
+            self.entry("client-1-clinician-2", '[{"action": "create", "start_time": "2025-01-06T11:00:00", "client_id": 1, "clinician_id": 2}]'),
+            self.entry("client-5-clinician-2", '[{"action": "create", "start_time": "2025-01-06T12:00:00", "client_id": 5, "clinician_id": 2}]'),
+        ]
+
+        with mock.patch("agents.appointment_request_agent.claude_client") as client, \
+                mock.patch("django.utils.timezone.localtime", return_value=local(2025, 1, 6, 10, 0)), \
+                mock.patch.object(agent, "get_appointments", return_value=[]), \
+                mock.patch.object(agent, "execute_actions", side_effect=[ValueError("Client 1 or clinician 2 not found"), []]):
+            client.messages.batches.retrieve.return_value.processing_status = "ended"
+            client.messages.batches.results.return_value = entries
+            outcomes = agent.collect_batch("batch")
+
+        self.assertEqual(outcomes["client-1-clinician-2"].status, "failed")
+        self.assertEqual(outcomes["client-1-clinician-2"].detail, "Client 1 or clinician 2 not found")
+        self.assertEqual(outcomes["client-5-clinician-2"].status, "booked")
+
+    def test_collect_command_prints_each_outcome(self):
+        outcomes = {
+            "client-1-clinician-2": BatchRequestOutcome(custom_id="client-1-clinician-2", status="booked"),
+            "client-5-clinician-2": BatchRequestOutcome(custom_id="client-5-clinician-2", status="conflict", detail="1 of 1 actions are in the past or overlap"),
+        }
+        stdout = StringIO()
+
+        with mock.patch.object(AppointmentRequestAgent, "collect_batch", return_value=outcomes):
+            call_command("batch_requests", "collect", "batch", stdout=stdout, no_color=True)
+
+        self.assertEqual(
+            stdout.getvalue().splitlines(),
+            ["client-1-clinician-2: booked", "client-5-clinician-2: conflict (1 of 1 actions are in the past or overlap)"],
+        )
+
+    def test_submit_rejects_duplicate_custom_ids(self):
+        request = AppointmentRequest(client_id=1, clinician_id=2, urgency=False)
+
+        with self.assertRaises(ValueError):
+            AppointmentRequestAgent().submit_batch([request, request])
+
+
+class CreateAppointmentTests(TestCase):
+    def setUp(self):
+        self.clinician = User.objects.create(username="clinician1")
+        self.client_row = Client.objects.create(first_name="Ada", last_name="Lovelace", clinician=self.clinician)
+
+    def test_accepts_negative_utc_offset(self):
+        response = self.client.post(
+            "/api/appointments/create/",
+            {"client": self.client_row.id, "start_time": "2030-01-15T14:00:00-05:00"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Appointment.objects.get().start_time, local(2030, 1, 15, 14, 0))
+
+
+class GetAppointmentsTests(TestCase):
+    def setUp(self):
+        self.clinician = User.objects.create(username="clinician1")
+        client = Client.objects.create(first_name="Ada", last_name="Lovelace", clinician=self.clinician)
+        self.appointment = Appointment.objects.create(client=client, clinician=self.clinician, start_time=local(2025, 1, 7, 10, 0))
+
+    def test_second_lookup_in_the_same_days_makes_no_query(self):
+        agent = AppointmentRequestAgent()
+        now = local(2025, 1, 6, 8, 0)
+
+        with self.assertNumQueries(1):
+            first = agent.get_upcoming_appointments(self.clinician.id, now)
+            second = agent.get_upcoming_appointments(self.clinician.id, now + timedelta(microseconds=1))
+
+        self.assertEqual([row.id for row in first], [self.appointment.id])
+        self.assertEqual(second, first)
+
+    def test_rows_outside_the_window_are_filtered(self):
+        agent = AppointmentRequestAgent()
+
+        rows = agent.get_appointments(self.clinician.id, local(2025, 1, 7, 10, 30), local(2025, 1, 7, 17, 0))
+
+        self.assertEqual(rows, [])
+
+
+class ExecuteActionsTests(TestCase):
+    def setUp(self):
+        self.clinician = User.objects.create(username="clinician1")
+        self.client_row = Client.objects.create(first_name="Ada", last_name="Lovelace", clinician=self.clinician)
+        self.booked = Appointment.objects.create(client=self.client_row, clinician=self.clinician, start_time=local(2025, 1, 6, 9, 0))
+
+    def test_creates_and_moves_appointments_in_one_pass(self):
+        actions = [
+            AppointmentAction(action="create", start_time=local(2025, 1, 6, 9, 0), client_id=self.client_row.id, clinician_id=self.clinician.id),
+            AppointmentAction(
+                action="update", start_time=local(2025, 1, 6, 10, 0), client_id=self.client_row.id,
+                clinician_id=self.clinician.id, appointment_id=self.booked.id,
+            ),
+        ]
+
+        # Three prefetches, then one INSERT and one UPDATE between a savepoint and its release
+        with self.assertNumQueries(7):
+            results = AppointmentRequestAgent().execute_actions(actions)
+
+        created = Appointment.objects.exclude(id=self.booked.id).get()
+        self.booked.refresh_from_db()
+        self.assertEqual([result.action_taken for result in results], ["created", "updated"])
+        self.assertEqual(results[0].appointment["id"], created.id)
+        self.assertEqual(results[1].appointment["id"], self.booked.id)
+        self.assertEqual(created.start_time, local(2025, 1, 6, 9, 0))
+        self.assertEqual(self.booked.start_time, local(2025, 1, 6, 10, 0))
+        self.assertEqual(results[0].appointment["start_time"], local(2025, 1, 6, 9, 0).isoformat())
+        self.assertEqual(results[1].appointment["start_time"], local(2025, 1, 6, 10, 0).isoformat())
+
+    def test_missing_client_writes_nothing(self):
+        action = AppointmentAction(action="create", start_time=local(2025, 1, 6, 11, 0), client_id=999, clinician_id=self.clinician.id)
+
+        with self.assertRaises(ValueError):
+            AppointmentRequestAgent().execute_actions([action])
+
+        self.assertEqual(Appointment.objects.count(), 1)
@@ -111,7 +111,7 @@ def request_appointment(request):
         from pytz import timezone, UTC
         from dateutil import parser
 
-        start_time = actions_taken[0].start_time
+        start_time = actions_taken[0].start_time.isoformat()
 
 
         # Broadcast notification to WebSocket clients
@@ -190,13 +190,12 @@ def create_appointment(request):
                 if start_time_str.endswith('Z'):
                     # UTC time
                     start_time = datetime.fromisoformat(start_time_str.replace('Z', '+00:00'))
-                elif '+' in start_time_str or start_time_str.endswith('Z'):
-                    # Already has timezone info
-                    start_time = datetime.fromisoformat(start_time_str)
                 else:
-                    # Naive datetime - treat as local time
+                    # Positive or negative offsets come back aware; only naive times need one
                     start_time = datetime.fromisoformat(start_time_str)
-                    start_time = timezone.make_aware(start_time)
+                    if timezone.is_naive(start_time):
+                        # Naive datetime - treat as local time
+                        start_time = timezone.make_aware(start_time)
             else:
                 # Fallback for other formats
                 start_time = datetime.strptime(start_time_str, '%Y-%m-%d %H:%M:%S')
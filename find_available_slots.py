@@ -15,6 +15,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'simple_scheduler.settings')
 django.setup()
 
 from appointments.models import Appointment, Client
+from agents.intervals import IntervalIndex
 from django.contrib.auth.models import User
 
 
@@ -31,21 +32,25 @@ def find_available_slots(clinician_id, start_timestamp, end_timestamp, slot_dura
     Returns:
         List of available datetime slots
     """
-    # Get all appointments for the clinician in the time range
-    existing_appointments = Appointment.objects.filter(
+    # Get all appointments for the clinician in the time range, reading only the
+    # columns needed for the busy periods in a single query
+    existing_appointments = list(Appointment.objects.filter(
         clinician_id=clinician_id,
         start_time__gte=start_timestamp,
         start_time__lt=end_timestamp
-    ).order_by('start_time')
+    ).order_by('start_time').values_list('start_time', 'duration_in_minutes'))
     
-    print(f"Found {existing_appointments.count()} existing appointments for clinician {clinician_id}")
+    print(f"Found {len(existing_appointments)} existing appointments for clinician {clinician_id}")
     
     # Create list of busy time periods
     busy_periods = []
-    for appointment in existing_appointments:
-        appointment_end = appointment.start_time + timedelta(minutes=appointment.duration_in_minutes)
-        busy_periods.append((appointment.start_time, appointment_end))
-        print(f"  Busy: {appointment.start_time} to {appointment_end}")
+    for start_time, duration_in_minutes in existing_appointments:
+        appointment_end = start_time + timedelta(minutes=duration_in_minutes)
+        busy_periods.append((start_time, appointment_end))
+        print(f"  Busy: {start_time} to {appointment_end}")
+    
+    # Index the busy periods once so each slot is a single binary search
+    busy_index = IntervalIndex(busy_periods)
     
     # Generate all possible slots
     available_slots = []
@@ -60,22 +65,18 @@ def find_available_slots(clinician_id, start_timestamp, end_timestamp, slot_dura
     business_end_hour = 17
     
     while current_slot < end_timestamp:
-        # Skip if outside business hours
-        if current_slot.hour < business_start_hour or current_slot.hour >= business_end_hour:
-            current_slot += timedelta(hours=1)
+        # Jump straight to the next business-hours start instead of stepping
+        # through the night hour by hour
+        if current_slot.hour < business_start_hour:
+            current_slot = current_slot.replace(hour=business_start_hour)
+            continue
+        if current_slot.hour >= business_end_hour:
+            current_slot = current_slot.replace(hour=business_start_hour) + timedelta(days=1)
             continue
         
         # Check if this slot conflicts with any existing appointment
         slot_end = current_slot + timedelta(minutes=slot_duration_minutes)
-        slot_conflicts = False
-        
-        for busy_start, busy_end in busy_periods:
-            # Check for overlap: (slot_start < busy_end) and (busy_start < slot_end)
-            if (current_slot < busy_end and busy_start < slot_end):
-                slot_conflicts = True
-                break
-        
-        if not slot_conflicts:
+        if not busy_index.overlaps(current_slot, slot_end):
             available_slots.append(current_slot)
         
         current_slot += timedelta(hours=1)
@@ -140,6 +140,10 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Appointment agent: schedule requests with the local solver instead of asking
+# Claude to rank candidate slots
+USE_LOCAL_SCHEDULER = True
+
 # CORS settings for frontend integration
 CORS_ALLOW_ALL_ORIGINS = True  # For development only
 